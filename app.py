@@ -1,31 +1,46 @@
 import os
+import math
 import uuid
+import time
 import shutil
+import hashlib
+import threading
 import mimetypes
+from collections import deque
 from flask import Flask, request, jsonify, render_template, send_from_directory
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 
-from cv_parser import parse_cv_multimodal, upload_to_gemini, extract_text_from_pdf
+from cv_parser import parse_cv_multimodal, upload_to_gemini, extract_text_from_pdf, extract_text_from_docx
 import google.generativeai as genai
 import json
 import datetime
 from cv_dividers_only import generate_divider, generate_divider_smaller, generate_divider_larger, generate_divider_tiny, create_circular_image_with_border
 from email_sender import send_cvs_email
-
-# Función stub para mantener compatibilidad si se llama, pero ya no usamos python-docx por peso
-def extract_text_from_docx(path):
-    print(f"Warning: DOCX extraction disabled for Vercel size limits.")
-    return ""
+from pipeline_profiler import PipelineProfiler, PROFILE_HEADER, profile_stage, profiling_requested, profile_header_allowed
+from memory_budget import MemoryTracker, memory_bounded
 
 app = Flask(__name__)
 CORS(app)
 
+# X-Forwarded-For solo es confiable detrás de un proxy conocido (Vercel pone VERCEL=1).
+# En local (run_cv_web.bat) cualquier cliente podría falsificarlo, así que se ignora.
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", "1" if os.environ.get("VERCEL") else "0"))
+if TRUSTED_PROXY_HOPS > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
+
 # En Vercel solo se puede escribir en /tmp
 UPLOAD_FOLDER = '/tmp/web_uploads'
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+if memory_bounded():
+    # Werkzeug already spools uploaded files to disk; cap the total body and tighten the
+    # in-memory limit per text field (Werkzeug default: 500 KB) so one request can't blow
+    # the instance's RSS target. 256 KB still fits any pasted CV text
+    app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get("CV_MAX_UPLOAD_MB", "32")) * 1024 * 1024
+    app.config['MAX_FORM_MEMORY_SIZE'] = int(os.environ.get("CV_MAX_FORM_FIELD_KB", "256")) * 1024
 HISTORY_FILE = os.path.join(UPLOAD_FOLDER, "history.json")
 
 def log_to_history(name, email, status):
@@ -58,24 +73,315 @@ def ping():
 def index():
     return render_template('index.html')
 
+# --- Single-flight de envíos duplicados ---
+# Doble click o reintentos del navegador mandan el mismo multipart: se ejecuta el pipeline
+# una sola vez y todos los pedidos idénticos reciben el mismo resultado.
+DEDUP_WINDOW_SECONDS = 120  # cuánto tiempo se reutiliza un resultado exitoso ya terminado
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.finished_at = None
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+def _hash_upload(file_storage) -> str:
+    """Hashes an uploaded file in chunks and rewinds it so it can still be saved."""
+    digest = hashlib.sha256()
+    stream = file_storage.stream
+    for chunk in iter(lambda: stream.read(1024 * 1024), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+def submission_fingerprint(raw_text, files, profile_file) -> str:
+    """Fingerprint of a /process submission: form text + upload hashes + photo hash."""
+    digest = hashlib.sha256()
+    digest.update(b"text\0" + raw_text.strip().encode("utf-8") + b"\0")
+    # Order of the extra files does not change the result
+    upload_hashes = sorted(_hash_upload(f) for f in files if f.filename != '')
+    for h in upload_hashes:
+        digest.update(b"file\0" + h.encode("ascii") + b"\0")
+    if profile_file and profile_file.filename != '':
+        digest.update(b"photo\0" + _hash_upload(profile_file).encode("ascii"))
+    return digest.hexdigest()
+
+def run_single_flight(key, fn):
+    """
+    Runs fn() once per key. Concurrent callers with the same key wait for the running call,
+    and callers within DEDUP_WINDOW_SECONDS of a successful run reuse its result.
+    Returns (result, shared) where shared is True if the result came from another request.
+    """
+    now = time.time()
+    with _flights_lock:
+        for k in [k for k, f in _flights.items() if f.finished_at and now - f.finished_at > DEDUP_WINDOW_SECONDS]:
+            del _flights[k]
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        flight.done.wait()
+        return flight.result, True
+
+    try:
+        flight.result = fn()
+    except Exception as e:
+        flight.result = ({"error": str(e)}, 500)
+    finally:
+        with _flights_lock:
+            flight.finished_at = time.time()
+            if flight.result is None or flight.result[1] != 200:
+                # Errors are shared with concurrent waiters but not cached: a retry runs again
+                _flights.pop(key, None)
+        flight.done.set()
+    return flight.result, False
+
+# --- Admission control ---
+# Cada /process dispara una llamada a Gemini y render de PDFs: se limita la concurrencia,
+# la cola de espera, la tasa por IP y el ritmo global contra la cuota de Gemini (RPM).
+def _env_number(name, default, cast, minimum, allow_equal=True):
+    """Reads a numeric setting, failing at startup (not on every request) if it's out of range."""
+    raw = os.environ.get(name, default)
+    try:
+        value = cast(raw)
+    except ValueError:
+        raise ValueError(f"{name} must be a number, got {raw!r}")
+    if value < minimum or (value == minimum and not allow_equal):
+        op = ">=" if allow_equal else ">"
+        raise ValueError(f"{name} must be {op} {minimum}, got {raw!r}")
+    return value
+
+MAX_IN_FLIGHT = _env_number("ADMISSION_MAX_IN_FLIGHT", "4", int, 1)
+MAX_QUEUE = _env_number("ADMISSION_MAX_QUEUE", "8", int, 0)
+QUEUE_TIMEOUT_SECONDS = _env_number("ADMISSION_QUEUE_TIMEOUT", "20", float, 0)
+RATE_LIMIT_PER_MINUTE = _env_number("RATE_LIMIT_PER_MINUTE", "6", float, 0, allow_equal=False)
+RATE_LIMIT_BURST = _env_number("RATE_LIMIT_BURST", "3", int, 1)
+GEMINI_RPM = _env_number("GEMINI_RPM", "15", int, 1)
+
+class TokenBucket:
+    def __init__(self, rate_per_second, capacity):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> float:
+        """Takes a token if available. Returns 0 on success, otherwise seconds until the next token."""
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self, timeout) -> float:
+        """Waits up to timeout seconds for a token. Returns 0 on success, otherwise the remaining wait."""
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire()
+            if wait == 0 or time.monotonic() + wait > deadline:
+                return wait
+            time.sleep(wait)
+
+    def is_full(self) -> bool:
+        with self.lock:
+            self._refill(time.monotonic())
+            return self.tokens >= self.capacity
+
+class SlidingWindowLimiter:
+    """
+    At most `limit` acquisitions in any `window` seconds (log of call timestamps).
+    Tracks a requests-per-minute quota exactly: unlike a token bucket it can't burst
+    a full window's worth and then refill on top of it.
+    """
+
+    def __init__(self, limit, window=60.0):
+        self.limit = limit
+        self.window = window
+        self.calls = deque()
+        self.lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """Records a call if the window has room. Returns 0 on success, otherwise seconds until it has."""
+        with self.lock:
+            now = time.monotonic()
+            while self.calls and now - self.calls[0] >= self.window:
+                self.calls.popleft()
+            if len(self.calls) < self.limit:
+                self.calls.append(now)
+                return 0.0
+            return self.calls[0] + self.window - now
+
+    def acquire(self, timeout) -> float:
+        """Waits up to timeout seconds for room. Returns 0 on success, otherwise the remaining wait."""
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire()
+            if wait == 0 or time.monotonic() + wait > deadline:
+                return wait
+            time.sleep(wait)
+
+class ClientRateLimiter:
+    """One token bucket per client IP; idle (full) buckets are dropped periodically."""
+
+    def __init__(self, per_minute, burst):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.last_cleanup = time.monotonic()
+
+    def try_acquire(self, client) -> float:
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_cleanup > 60:
+                self.buckets = {k: b for k, b in self.buckets.items() if not b.is_full()}
+                self.last_cleanup = now
+            bucket = self.buckets.get(client)
+            if bucket is None:
+                bucket = self.buckets[client] = TokenBucket(self.rate, self.burst)
+        return bucket.try_acquire()
+
+class AdmissionController:
+    """Bounded number of pipelines in flight plus a short wait queue with a deadline."""
+
+    def __init__(self, max_in_flight, max_queue, timeout):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.avg_seconds = 30.0  # EWMA of pipeline duration, used for Retry-After
+        self.cond = threading.Condition()
+
+    def acquire(self) -> bool:
+        with self.cond:
+            if self.in_flight < self.max_in_flight:
+                self.in_flight += 1
+                return True
+            if self.waiting >= self.max_queue:
+                return False  # Queue full: reject right away
+            self.waiting += 1
+            try:
+                admitted = self.cond.wait_for(lambda: self.in_flight < self.max_in_flight, self.timeout)
+                if admitted:
+                    self.in_flight += 1
+                return admitted
+            finally:
+                self.waiting -= 1
+
+    def release(self, elapsed):
+        with self.cond:
+            self.in_flight -= 1
+            self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * elapsed
+            self.cond.notify()
+
+    def retry_after(self) -> int:
+        with self.cond:
+            return max(1, math.ceil(self.avg_seconds * (self.waiting + 1) / self.max_in_flight))
+
+    def stats(self):
+        with self.cond:
+            return {
+                "in_flight": self.in_flight,
+                "queue_depth": self.waiting,
+                "max_in_flight": self.max_in_flight,
+                "max_queue": self.max_queue,
+                "avg_seconds": round(self.avg_seconds, 2),
+            }
+
+admission = AdmissionController(MAX_IN_FLIGHT, MAX_QUEUE, QUEUE_TIMEOUT_SECONDS)
+client_limiter = ClientRateLimiter(RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST)
+gemini_limiter = SlidingWindowLimiter(GEMINI_RPM, 60.0)
+
+def _client_ip():
+    # With TRUSTED_PROXY_HOPS set, ProxyFix has already put the real client IP in remote_addr
+    return request.remote_addr or 'unknown'
+
+def _rejected(message, status, retry_after):
+    return {"error": message, "retry_after": max(1, math.ceil(retry_after))}, status
+
+def run_admitted(fn):
+    """Runs fn() once it gets an in-flight slot and a Gemini quota token, or returns a 503."""
+    start = time.monotonic()
+    if not admission.acquire():
+        print(f"Admission: rejected, no slot within deadline ({admission.stats()}).")
+        return _rejected("Server busy, please retry later", 503, admission.retry_after())
+    try:
+        remaining = QUEUE_TIMEOUT_SECONDS - (time.monotonic() - start)
+        wait = gemini_limiter.acquire(max(0.0, remaining))
+        if wait:
+            print(f"Admission: Gemini quota exhausted, retry in {wait:.1f}s.")
+            return _rejected("Model quota exhausted, please retry later", 503, wait)
+        return fn()
+    finally:
+        admission.release(time.monotonic() - start)
+
+@app.route('/status')
+def admission_status():
+    return jsonify(admission.stats())
+
 @app.route('/process', methods=['POST'])
 def process():
+    # Per-client limit first: it's checked before the upload body is parsed
+    wait = client_limiter.try_acquire(_client_ip())
+    if wait:
+        payload, status = _rejected("Too many requests, please wait before retrying", 429, wait)
+        return jsonify(payload), status, {"Retry-After": str(payload["retry_after"])}
+
+    raw_text = request.form.get('text', '')
+    files = request.files.getlist('files')
+    profile_file = request.files.get('profile_photo')
+
+    profile_via_header = profile_header_allowed(request.headers.get(PROFILE_HEADER, ''))
+    profile = profiling_requested(profile_via_header)
+
+    fingerprint = submission_fingerprint(raw_text, files, profile_file)
+    if profile_via_header:
+        # An explicitly requested profile must actually run: unique key, so it neither joins
+        # nor caches a result. With CV_PROFILE=1 server-wide the leader is profiled and
+        # duplicates keep coalescing (no duplicate emails because of a diagnostics switch).
+        fingerprint += f":profile:{uuid.uuid4()}"
+    # Only the single-flight leader takes an admission slot; coalesced duplicates just wait
+    (payload, status), shared = run_single_flight(
+        fingerprint, lambda: run_admitted(lambda: _process_submission(raw_text, files, profile_file, profile=profile)))
+    if shared:
+        print(f"[{payload.get('session_id', '-')}] Duplicate submission coalesced ({fingerprint[:12]}).")
+        payload = dict(payload, deduplicated=True)
+    if "retry_after" in payload:
+        return jsonify(payload), status, {"Retry-After": str(payload["retry_after"])}
+    return jsonify(payload), status
+
+def _process_submission(raw_text, files, profile_file, profile=False):
     session_id = str(uuid.uuid4())
     session_path = os.path.join(app.config['UPLOAD_FOLDER'], session_id)
     os.makedirs(session_path)
 
+    if not profile:
+        return _run_pipeline(session_id, session_path, raw_text, files, profile_file)
+    # Profile saved next to the session output: /tmp/web_uploads/<session_id>/profile
+    with PipelineProfiler(session_path, label=session_id):
+        return _run_pipeline(session_id, session_path, raw_text, files, profile_file)
+
+def _run_pipeline(session_id, session_path, raw_text, files, profile_file):
+    memory = MemoryTracker()
     try:
         # 1. Handle Text Input
-        raw_text = request.form.get('text', '')
         if raw_text:
             text_file_path = os.path.join(session_path, 'pasted_info.txt')
             with open(text_file_path, 'w', encoding='utf-8') as f:
                 f.write(raw_text)
 
         # 2. Handle File Uploads
-        files = request.files.getlist('files')
-        profile_file = request.files.get('profile_photo')
-        
         gemini_inputs = []
         profile_image_path = None
 
@@ -121,18 +427,20 @@ def process():
                 gemini_inputs.append(file_path)
 
         if not gemini_inputs and not profile_image_path:
-            return jsonify({"error": "No data provided"}), 400
+            return {"error": "No data provided"}, 400
 
         # 3. Call Automation Engine
         print(f"[{session_id}] Parsing CV data...")
-        cv_data = parse_cv_multimodal(gemini_inputs)
+        with profile_stage("parsing"), memory.stage("parsing"):
+            cv_data = parse_cv_multimodal(gemini_inputs)
         
         # 4. Image Processing
         processed_image_out = None
         if profile_image_path:
             print(f"[{session_id}] Processing profile image...")
             processed_image_out = os.path.join(session_path, "processed_profile.png")
-            create_circular_image_with_border(profile_image_path, processed_image_out)
+            with profile_stage("image_processing"), memory.stage("image_processing"):
+                create_circular_image_with_border(profile_image_path, processed_image_out)
 
         # 5. PDF Generation
         print(f"[{session_id}] Generating PDFs...")
@@ -140,10 +448,11 @@ def process():
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
             
-        p1 = generate_divider(cv_data, output_dir, processed_image_out)
-        p2 = generate_divider_smaller(cv_data, output_dir, processed_image_out)
-        p3 = generate_divider_larger(cv_data, output_dir, processed_image_out)
-        p4 = generate_divider_tiny(cv_data, output_dir, processed_image_out)
+        with profile_stage("pdf_generation"), memory.stage("pdf_generation"):
+            p1 = generate_divider(cv_data, output_dir, processed_image_out)
+            p2 = generate_divider_smaller(cv_data, output_dir, processed_image_out)
+            p3 = generate_divider_larger(cv_data, output_dir, processed_image_out)
+            p4 = generate_divider_tiny(cv_data, output_dir, processed_image_out)
         
         generated_pdfs = [p1, p2, p3, p4]
 
@@ -170,24 +479,30 @@ def process():
             print(f"[{session_id}] Warning: No candidate email found in parsed JSON.")
         else:
             print(f"[{session_id}] Sending email to {candidate_email}...")
-            success = send_cvs_email(candidate_email, generated_pdfs, candidate_name, gmail_user, gmail_pass)
+            with profile_stage("email"), memory.stage("email"):
+                success = send_cvs_email(candidate_email, generated_pdfs, candidate_name, gmail_user, gmail_pass)
             if not success:
                 email_status = "Failed"
                 email_error = "SMTP Error"
 
         log_to_history(candidate_name, candidate_email or "N/A", email_status)
 
-        return jsonify({
+        result = {
             "status": "success",
             "session_id": session_id,
             "candidate": candidate_name,
             "email_status": email_status,
             "pdfs": [os.path.basename(p) for p in generated_pdfs]
-        })
+        }
+        if memory.enabled:
+            result["memory"] = memory.report()
+        return result, 200
 
     except Exception as e:
         print(f"[{session_id}] Error: {e}")
-        return jsonify({"error": str(e)}), 500
+        return {"error": str(e)}, 500
+    finally:
+        memory.close()
 
 @app.route('/history')
 def get_history():
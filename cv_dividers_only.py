@@ -12,10 +12,20 @@ from reportlab.lib.units import cm
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Flowable
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from PIL import Image as PILImage, ImageOps, ImageDraw
+from pipeline_profiler import profile_stage
+from memory_budget import memory_bounded, BOUNDED_PHOTO_MAX_EDGE
 
-def create_circular_image_with_border(image_path: str, output_path: str, border_color: str = "#4f81bd", border_width: int = 2):
+def create_circular_image_with_border(image_path: str, output_path: str, border_color: str = "#4f81bd", border_width: int = 2,
+                                      max_size: Optional[int] = None):
+    if max_size is None and memory_bounded():
+        max_size = BOUNDED_PHOTO_MAX_EDGE
     try:
-        img = PILImage.open(image_path).convert("RGBA")
+        with PILImage.open(image_path) as src:
+            if max_size and min(src.size) > max_size:
+                # JPEG: decode directly at a reduced scale (short edge still >= max_size)
+                scale = max_size / min(src.size)
+                src.draft("RGB", (int(src.size[0] * scale) + 1, int(src.size[1] * scale) + 1))
+            img = src.convert("RGBA")
         
         # Crop to square
         w, h = img.size
@@ -25,6 +35,8 @@ def create_circular_image_with_border(image_path: str, output_path: str, border_
         right = (w + min_dim)/2
         bottom = (h + min_dim)/2
         img = img.crop((left, top, right, bottom))
+        if max_size and img.size[0] > max_size:
+            img = img.resize((max_size, max_size), PILImage.LANCZOS)
         
         # Create mask
         mask = PILImage.new('L', img.size, 0)
@@ -196,13 +208,15 @@ def build_dividers_pdf(data: Dict[str,Any], out_path: str, image_path: Optional[
     doc = SimpleDocTemplate(out_path, pagesize=A4,
                             leftMargin=2*cm, rightMargin=2*cm,
                             topMargin=1.0*cm, bottomMargin=1.0*cm)
-    story = _story_dividers(data, styles, fonts, image_path=image_path)
+    with profile_stage("_story_dividers"):
+        story = _story_dividers(data, styles, fonts, image_path=image_path)
     # Ensure dir exists
     out_dir = os.path.dirname(out_path)
     if not os.path.exists(out_dir):
         os.makedirs(out_dir)
         
-    doc.build(story)
+    with profile_stage("doc.build"):
+        doc.build(story)
     return out_path
 
 def generate_divider(data: Dict[str,Any], out_dir: str="/mnt/data", image_path: Optional[str]=None) -> str:
@@ -58,32 +58,297 @@ REGLAS CRÍTICAS DE INTELIGENCIA Y FORMATO:
     
 import mimetypes
 import time
+import atexit
+import hashlib
+import tempfile
+import threading
+from PIL import Image as PILImage, ImageOps, ImageStat
+from pipeline_profiler import profile_stage
+from memory_budget import memory_bounded
 
 def extract_text_from_pdf(pdf_path: str) -> str:
     """Extracts all text from a PDF file locally using pypdf."""
-    text = ""
+    pages = []
     try:
         reader = pypdf.PdfReader(pdf_path)
+        # Page by page into a list (no quadratic string concatenation)
         for page in reader.pages:
-            text += page.extract_text() + "\n"
+            pages.append((page.extract_text() or "") + "\n")
     except Exception as e:
         print(f"Error extracting text from PDF {pdf_path}: {e}")
-    return text
+    return "".join(pages)
 
-def upload_to_gemini(path: str, mime_type: str = None):
-    """Uploads the given file to Gemini."""
-    file = genai.upload_file(path, mime_type=mime_type)
-    # print(f"Uploaded file '{file.display_name}' as: {file.uri}")
+# Image preprocessing for content images (not the profile photo)
+# 2000px on the long edge keeps CV text legible for Gemini while cutting multi-MB camera shots
+IMAGE_MAX_EDGE = int(os.environ.get("CV_IMAGE_MAX_EDGE", "2000"))
+IMAGE_JPEG_QUALITY = int(os.environ.get("CV_IMAGE_JPEG_QUALITY", "85"))
+# Mean saturation (0-255) below which an image is treated as black & white text
+IMAGE_GRAYSCALE_MAX_SATURATION = 24
+
+def preprocess_image_for_upload(image_path: str, max_edge: int = None) -> tuple[str, str]:
+    """
+    Normalizes EXIF orientation, downscales to max_edge on the long side, converts
+    near-monochrome images to grayscale and re-encodes as JPEG in a temp file.
+    Returns (path, mime_type) of the file to upload; the original path if preprocessing
+    fails or doesn't make the file smaller.
+    """
+    max_edge = max_edge or IMAGE_MAX_EDGE
+    original_mime, _ = mimetypes.guess_type(image_path)
+    try:
+        with PILImage.open(image_path) as src:
+            original_size = src.size
+            if memory_bounded() and max(src.size) > max_edge:
+                # JPEG: decode at a reduced scale (long edge still >= max_edge) instead of full resolution
+                scale = max_edge / max(src.size)
+                src.draft("RGB", (int(src.size[0] * scale), int(src.size[1] * scale)))
+            rotated = src.getexif().get(0x0112, 1) != 1  # EXIF Orientation tag
+            img = ImageOps.exif_transpose(src)
+            if img.mode in ("RGBA", "LA", "P"):
+                # Flatten transparency on white (JPEG has no alpha)
+                rgba = img.convert("RGBA")
+                img = PILImage.new("RGB", rgba.size, (255, 255, 255))
+                img.paste(rgba, mask=rgba.getchannel("A"))
+            elif img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+
+            resized = max(img.size) > max_edge or src.size != original_size
+            if resized:
+                img.thumbnail((max_edge, max_edge), PILImage.LANCZOS)
+
+            if img.mode == "RGB":
+                # Measure saturation on a small copy so this stays cheap
+                probe = img.copy()
+                probe.thumbnail((256, 256))
+                saturation = ImageStat.Stat(probe.convert("HSV")).mean[1]
+                if saturation < IMAGE_GRAYSCALE_MAX_SATURATION:
+                    img = img.convert("L")
+
+            fd, out_path = tempfile.mkstemp(suffix=".jpg", prefix="cv_upload_")
+            with os.fdopen(fd, "wb") as out:
+                img.save(out, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+    except Exception as e:
+        print(f"Warning: Could not preprocess image {os.path.basename(image_path)}, uploading original: {e}")
+        return image_path, original_mime
+
+    before = os.path.getsize(image_path)
+    after = os.path.getsize(out_path)
+    if after >= before and not (rotated or resized):
+        os.remove(out_path)
+        print(f"Image {os.path.basename(image_path)}: already compact ({before // 1024} KB), uploading original.")
+        return image_path, original_mime
+
+    print(f"Image {os.path.basename(image_path)}: {before // 1024} KB -> {after // 1024} KB "
+          f"(saved {before - after} bytes, {img.size[0]}x{img.size[1]} {img.mode}).")
+    return out_path, "image/jpeg"
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+
+def extract_text_from_docx(docx_path: str) -> str:
+    """
+    Extracts text from a DOCX file without python-docx.
+    Streams word/document.xml out of the zip with iterparse and clears each paragraph/table
+    once emitted, so memory stays bounded. Paragraphs, list items ("• ") and table rows
+    (cells joined with " | ") come out in document order.
+    """
+    # Imported lazily: only paid when a DOCX actually shows up
+    import zipfile
+    from xml.etree.ElementTree import iterparse
+
+    lines = []
+    try:
+        with zipfile.ZipFile(docx_path) as zf, zf.open("word/document.xml") as xml_file:
+            paragraphs = []   # stack of [parts, list_level] (text boxes can nest paragraphs)
+            cells = []        # stack of lines of the open table cells
+            rows = []         # stack of cells of the open table rows
+            parents = []
+            skip_depth = 0    # inside mc:Fallback (duplicated content of text boxes)
+
+            for event, elem in iterparse(xml_file, events=("start", "end")):
+                tag = elem.tag
+                if event == "start":
+                    parents.append(elem)
+                    if tag == _MC_FALLBACK:
+                        skip_depth += 1
+                    elif skip_depth:
+                        pass
+                    elif tag == _W + "p":
+                        paragraphs.append([[], None])
+                    elif tag == _W + "tr":
+                        rows.append([])
+                    elif tag == _W + "tc":
+                        cells.append([])
+                    continue
+
+                parents.pop()
+                if tag == _MC_FALLBACK:
+                    skip_depth -= 1
+                    elem.clear()
+                    continue
+                if skip_depth:
+                    continue
+
+                if tag == _W + "t":
+                    if paragraphs and elem.text:
+                        paragraphs[-1][0].append(elem.text)
+                elif tag == _W + "tab":
+                    if paragraphs:
+                        paragraphs[-1][0].append("\t")
+                elif tag in (_W + "br", _W + "cr"):
+                    if paragraphs:
+                        paragraphs[-1][0].append("\n")
+                elif tag == _W + "ilvl":
+                    if paragraphs:
+                        paragraphs[-1][1] = int(elem.get(_W + "val", "0") or 0)
+                elif tag == _W + "numPr":
+                    if paragraphs and paragraphs[-1][1] is None:
+                        paragraphs[-1][1] = 0
+                elif tag == _W + "p":
+                    parts, level = paragraphs.pop()
+                    text = "".join(parts).strip()
+                    if text:
+                        if level is not None:
+                            text = "  " * level + "• " + text
+                        (cells[-1] if cells else lines).append(text)
+                elif tag == _W + "tc":
+                    cell_text = " ".join(cells.pop())
+                    if rows:
+                        rows[-1].append(cell_text)
+                elif tag == _W + "tr":
+                    row = [c for c in rows.pop() if c]
+                    if row:
+                        (cells[-1] if cells else lines).append(" | ".join(row))
+
+                if tag in (_W + "p", _W + "tbl"):
+                    # Drop the processed subtree; at body level drop the emptied element too
+                    elem.clear()
+                    if parents and parents[-1].tag == _W + "body":
+                        parents[-1].remove(elem)
+    except Exception as e:
+        print(f"Error extracting text from DOCX {docx_path}: {e}")
+    return "\n".join(lines)
+
+MODEL_NAME = 'gemini-flash-latest'
+_model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    """Process-wide GenerativeModel, created on first use so its client/connection is reused."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = genai.GenerativeModel(MODEL_NAME)
+    return _model
+
+# --- Registry of uploaded files ---
+# Keyed by content hash so retries/repeated jobs reuse the remote file instead of uploading again.
+# Files unused for UPLOAD_RETENTION_SECONDS are deleted from Gemini by a background thread.
+UPLOAD_RETENTION_SECONDS = int(os.environ.get("GEMINI_UPLOAD_RETENTION", "3600"))
+UPLOAD_EXPIRY_MARGIN_SECONDS = 600   # don't reuse a file this close to its remote expiration
+UPLOAD_DEFAULT_TTL_SECONDS = 47 * 3600  # Gemini keeps uploads ~48 h
+UPLOAD_CLEANUP_INTERVAL_SECONDS = 60
+
+_uploads = {}   # content hash -> {"file", "expires_at", "last_used"}
+_uploads_lock = threading.Lock()
+# Striped per-key locks: two jobs with the same content upload it once (single-flight)
+_upload_key_locks = [threading.Lock() for _ in range(32)]
+_cleanup_thread = None
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _expires_at(file) -> float:
+    expiration = getattr(file, "expiration_time", None)
+    try:
+        return expiration.timestamp()
+    except Exception:
+        return time.time() + UPLOAD_DEFAULT_TTL_SECONDS
+
+def get_uploaded_file(key: str):
+    """Returns the registered remote file for key if it is still valid, else None."""
+    now = time.time()
+    with _uploads_lock:
+        entry = _uploads.get(key)
+        if entry is None:
+            return None
+        if entry["expires_at"] - now < UPLOAD_EXPIRY_MARGIN_SECONDS:
+            # Expired (or about to) on Gemini's side: nothing left to delete
+            del _uploads[key]
+            return None
+        entry["last_used"] = now
+        return entry["file"]
+
+def _delete_remote(file):
+    try:
+        genai.delete_file(file.name)
+    except Exception as e:
+        print(f"Warning: Could not delete Gemini file {getattr(file, 'name', '?')}: {e}")
+
+def cleanup_uploads(max_idle_seconds: float = None):
+    """Deletes remote files not used for max_idle_seconds (all of them with 0)."""
+    if max_idle_seconds is None:
+        max_idle_seconds = UPLOAD_RETENTION_SECONDS
+    now = time.time()
+    with _uploads_lock:
+        stale = [k for k, e in _uploads.items()
+                 if now - e["last_used"] >= max_idle_seconds or e["expires_at"] <= now]
+        stale_files = [_uploads.pop(k)["file"] for k in stale]
+    for file in stale_files:
+        _delete_remote(file)
+    return len(stale_files)
+
+def _cleanup_loop():
+    while True:
+        time.sleep(UPLOAD_CLEANUP_INTERVAL_SECONDS)
+        cleanup_uploads()
+
+def _start_cleanup_thread():
+    global _cleanup_thread
+    if _cleanup_thread is None:
+        _cleanup_thread = threading.Thread(target=_cleanup_loop, name="gemini-upload-cleanup", daemon=True)
+        _cleanup_thread.start()
+        # Nothing can reuse the files once the process ends
+        atexit.register(cleanup_uploads, 0)
+
+def upload_to_gemini(path: str, mime_type: str = None, cache_key: str = None):
+    """Uploads the given file to Gemini, reusing a valid earlier upload of the same content."""
+    key = cache_key or file_sha256(path)
+    with _upload_key_locks[hash(key) % len(_upload_key_locks)]:
+        file = get_uploaded_file(key)
+        if file is not None:
+            print(f"Reusing Gemini upload for {os.path.basename(path)} ({file.name}).")
+            return file
+        file = genai.upload_file(path, mime_type=mime_type)
+        # print(f"Uploaded file '{file.display_name}' as: {file.uri}")
+        now = time.time()
+        duplicate = None
+        with _uploads_lock:
+            existing = _uploads.get(key)
+            if existing is not None and existing["expires_at"] - now >= UPLOAD_EXPIRY_MARGIN_SECONDS:
+                # Registered meanwhile (shouldn't happen under the key lock): keep the tracked one
+                duplicate, file = file, existing["file"]
+                existing["last_used"] = now
+            else:
+                _uploads[key] = {"file": file, "expires_at": _expires_at(file), "last_used": now}
+            _start_cleanup_thread()
+    if duplicate is not None:
+        _delete_remote(duplicate)
     return file
 
 def parse_cv_multimodal(file_paths: list[str]) -> Dict[str, Any]:
     """
-    Sends multiple files (text, images, PDFs) to Gemini and returns structured JSON data.
+    Sends multiple files (text, images, PDFs, DOCX) to Gemini and returns structured JSON data.
     """
     if not API_KEY:
          raise ValueError("GEMINI_API_KEY environment variable not found.")
 
-    model = genai.GenerativeModel('gemini-flash-latest') 
+    model = get_model()
     
     content_parts = [SYSTEM_PROMPT, "\n\nINFORMACIÓN DEL USUARIO (Analiza todos los archivos adjuntos):"]
     
@@ -100,6 +365,14 @@ def parse_cv_multimodal(file_paths: list[str]) -> Dict[str, Any]:
                     content_parts.append(f"\n--- Archivo (Texto): {os.path.basename(path)} ---\n{text_content}")
             except Exception as e:
                 print(f"Error reading text file {path}: {e}")
+        elif mime_type == DOCX_MIME or path.lower().endswith('.docx'):
+            # Gemini does not accept DOCX uploads: extract the text locally
+            print(f"Extracting text from DOCX locally: {os.path.basename(path)}...")
+            docx_text = extract_text_from_docx(path)
+            if docx_text:
+                content_parts.append(f"\n--- Archivo (DOCX): {os.path.basename(path)} ---\n{docx_text}")
+            else:
+                print(f"Warning: No text found in DOCX {os.path.basename(path)}, skipping.")
         elif mime_type == 'application/pdf':
             # Local extraction for PDF to avoid upload timeouts
             print(f"Extracting text from PDF locally: {os.path.basename(path)}...")
@@ -116,12 +389,26 @@ def parse_cv_multimodal(file_paths: list[str]) -> Dict[str, Any]:
                     print(f"Error uploading file {path}: {e}")
         else:
             # Upload binary files (Images)
+            upload_path = path
             try:
-                print(f"Uploading to Gemini: {os.path.basename(path)}...")
-                uploaded_file = upload_to_gemini(path, mime_type=mime_type)
+                # Keyed on the original bytes (+ preprocessing settings) so a reuse skips preprocessing too
+                cache_key = f"{file_sha256(path)}:{IMAGE_MAX_EDGE}:{IMAGE_JPEG_QUALITY}"
+                uploaded_file = get_uploaded_file(cache_key)
+                if uploaded_file is None:
+                    if mime_type and mime_type.startswith('image'):
+                        # Screenshots/photos of old CVs: shrink before upload
+                        with profile_stage("image_preprocess"):
+                            upload_path, mime_type = preprocess_image_for_upload(path)
+                    print(f"Uploading to Gemini: {os.path.basename(path)}...")
+                    uploaded_file = upload_to_gemini(upload_path, mime_type=mime_type, cache_key=cache_key)
+                else:
+                    print(f"Reusing Gemini upload for {os.path.basename(path)} ({uploaded_file.name}).")
                 content_parts.append(uploaded_file)
             except Exception as e:
                 print(f"Error uploading file {path}: {e}")
+            finally:
+                if upload_path != path and os.path.exists(upload_path):
+                    os.remove(upload_path)
 
     try:
         response = model.generate_content(
@@ -1,13 +1,75 @@
 import smtplib
 import os
+import re
+import uuid
+import base64
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
+from memory_budget import memory_bounded
 
-def send_cvs_email(to_email: str, attachment_paths: list[str], candidate_name: str, gmail_user: str, gmail_password: str):
+# 57 raw bytes -> one 76-char base64 line; read attachments 1 MB (rounded) at a time
+_B64_CHUNK = 57 * 18396
+
+def _iter_attachment(file_path: str, boundary: str):
+    """Yields one base64 MIME part for file_path, reading the file in chunks."""
+    name = os.path.basename(file_path).encode("ascii", "replace").decode("ascii").replace('"', "_")
+    yield (f"--{boundary}\r\n"
+           f"Content-Type: application/octet-stream; Name=\"{name}\"\r\n"
+           "MIME-Version: 1.0\r\n"
+           "Content-Transfer-Encoding: base64\r\n"
+           f"Content-Disposition: attachment; filename=\"{name}\"\r\n\r\n").encode("ascii")
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(_B64_CHUNK), b""):
+            yield base64.encodebytes(chunk).replace(b"\n", b"\r\n")
+
+def _send_streaming(smtp, msg, attachment_paths: list[str]):
+    """
+    Sends msg plus the attachments without building the full message in memory:
+    the attachments are base64-encoded chunk by chunk straight into the SMTP DATA stream.
+    """
+    boundary = f"===============_{uuid.uuid4().hex}"
+    msg.set_boundary(boundary)
+    # Same serialization smtplib.send_message uses, with CRLF line endings
+    skeleton = msg.as_bytes(policy=msg.policy.clone(linesep="\r\n"))
+    closing = f"--{boundary}--".encode("ascii")
+    cut = skeleton.rindex(closing)
+    # Dot-stuffing (RFC 5321); base64 lines never start with "."
+    head = re.sub(br"(?m)^\.", b"..", skeleton[:cut])
+    tail = re.sub(br"(?m)^\.", b"..", skeleton[cut:])
+
+    smtp.ehlo_or_helo_if_needed()
+    code, resp = smtp.mail(msg['From'])
+    if code != 250:
+        raise smtplib.SMTPSenderRefused(code, resp, msg['From'])
+    code, resp = smtp.rcpt(msg['To'])
+    if code not in (250, 251):
+        raise smtplib.SMTPRecipientsRefused({msg['To']: (code, resp)})
+    code, resp = smtp.docmd("data")
+    if code != 354:
+        raise smtplib.SMTPDataError(code, resp)
+
+    smtp.send(head)
+    for file_path in attachment_paths:
+        for chunk in _iter_attachment(file_path, boundary):
+            smtp.send(chunk)
+    if not tail.endswith(b"\r\n"):
+        tail += b"\r\n"
+    smtp.send(tail + b".\r\n")
+    code, resp = smtp.getreply()
+    if code != 250:
+        raise smtplib.SMTPDataError(code, resp)
+
+def send_cvs_email(to_email: str, attachment_paths: list[str], candidate_name: str, gmail_user: str, gmail_password: str,
+                   stream_attachments: bool = None):
     """
     Sends an email with the CV PDFs attached via Gmail.
+    With stream_attachments (default: on in memory-bounded mode) the PDFs are never
+    loaded whole into memory.
     """
+    if stream_attachments is None:
+        stream_attachments = memory_bounded()
+
     msg = MIMEMultipart()
     msg['Subject'] = f"Tu Nuevo CV Optimizado - {candidate_name}"
     msg['From'] = gmail_user
@@ -53,20 +115,26 @@ def send_cvs_email(to_email: str, attachment_paths: list[str], candidate_name: s
     """
     msg.attach(MIMEText(body_html, 'html'))
 
+    existing_paths = []
     for file_path in attachment_paths:
-        if os.path.exists(file_path):
+        if not os.path.exists(file_path):
+            print(f"Warning: Attachment not found: {file_path}")
+        elif stream_attachments:
+            existing_paths.append(file_path)
+        else:
             with open(file_path, "rb") as f:
                 part = MIMEApplication(f.read(), Name=os.path.basename(file_path))
             part['Content-Disposition'] = f'attachment; filename="{os.path.basename(file_path)}"'
             msg.attach(part)
-        else:
-            print(f"Warning: Attachment not found: {file_path}")
 
     try:
         print(f"Connecting to Gmail SMTP to send to {to_email}...")
         with smtplib.SMTP_SSL('smtp.gmail.com', 465) as smtp:
             smtp.login(gmail_user, gmail_password)
-            smtp.send_message(msg)
+            if stream_attachments:
+                _send_streaming(smtp, msg, existing_paths)
+            else:
+                smtp.send_message(msg)
         print("Finalizing: Email sent successfully.")
         return True
     except Exception as e:
@@ -0,0 +1,223 @@
+"""
+folder_watcher.py — modo daemon del CV bot.
+Vigila una carpeta "inbox" y procesa cada carpeta de cliente nueva en un pool de
+workers persistente, de modo que el intérprete y los imports (genai, ReportLab, PIL)
+se cargan una sola vez y cada cliente paga solo el tiempo del pipeline.
+"""
+
+import os
+import json
+import time
+import shutil
+import datetime
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+# Archivo que el operador crea dentro de la carpeta para indicar que terminó de copiar.
+READY_MARKER = ".ready"
+# Lo escribe el daemon si no pudo mover una carpeta ya procesada: nunca se vuelve a tomar.
+PROCESSED_MARKER = ".processed"
+STATUS_FILE = "_status.json"
+
+def _folder_state(folder_path: str) -> tuple:
+    """
+    Returns (latest mtime, entry count, total size) of the folder and everything inside it.
+    Count and size catch copies that preserve the source mtimes (Explorer, robocopy, cp -p).
+    """
+    latest = os.path.getmtime(folder_path)
+    count = 0
+    size = 0
+    for root, dirs, files in os.walk(folder_path):
+        for name in dirs + files:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except OSError:
+                # The file may disappear while the operator is still copying
+                continue
+            latest = max(latest, st.st_mtime)
+            count += 1
+            size += st.st_size
+    return latest, count, size
+
+def _unique_destination(dest_dir: str, name: str) -> str:
+    dest = os.path.join(dest_dir, name)
+    if not os.path.exists(dest):
+        return dest
+    stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(dest_dir, f"{name}_{stamp}")
+
+class FolderWatcher:
+    def __init__(self, inbox_dir: str, process_fn: Callable[[str], bool],
+                 done_dir: Optional[str] = None, failed_dir: Optional[str] = None,
+                 workers: int = 2, quiet_seconds: float = 10.0, poll_seconds: float = 2.0,
+                 ready_marker: str = READY_MARKER):
+        self.inbox_dir = os.path.abspath(inbox_dir)
+        parent = os.path.dirname(self.inbox_dir)
+        self.done_dir = os.path.abspath(done_dir or os.path.join(parent, "done"))
+        self.failed_dir = os.path.abspath(failed_dir or os.path.join(parent, "failed"))
+        self.process_fn = process_fn
+        self.workers = max(1, workers)
+        self.quiet_seconds = quiet_seconds
+        self.poll_seconds = poll_seconds
+        self.ready_marker = ready_marker
+
+        for d in (self.inbox_dir, self.done_dir, self.failed_dir):
+            if not os.path.exists(d):
+                os.makedirs(d)
+
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="cv-worker")
+        self._lock = threading.Lock()
+        self._queued = set()          # carpetas enviadas al pool (pendientes o en proceso)
+        self._stuck = set()           # procesadas pero no se pudieron mover: no re-procesar
+        self._snapshots = {}          # carpeta -> ((cantidad, tamaño), desde cuándo no cambia)
+        self._running = 0
+        self._processed = 0
+        self._failed = 0
+        self._finished_at = deque()   # timestamps de trabajos terminados (ventana de throughput)
+        self._total_seconds = 0.0
+        self._started_at = time.time()
+
+    # --- Detection ---
+    def _is_ready(self, folder_path: str) -> bool:
+        if os.path.exists(os.path.join(folder_path, self.ready_marker)):
+            return True
+        # Sin marcador: la carpeta está lista cuando ni mtimes ni cantidad/tamaño de archivos
+        # cambiaron durante el período de silencio
+        now = time.time()
+        latest_mtime, count, size = _folder_state(folder_path)
+        previous = self._snapshots.get(folder_path)
+        if previous is None or previous[0] != (count, size):
+            self._snapshots[folder_path] = ((count, size), now)
+            return False
+        stable_since = previous[1]
+        return now - max(latest_mtime, stable_since) >= self.quiet_seconds
+
+    def scan_once(self) -> int:
+        """Submits every finished client folder in the inbox. Returns how many were queued."""
+        submitted = 0
+        seen = set()
+        for name in sorted(os.listdir(self.inbox_dir)):
+            if name.startswith((".", "_")):
+                continue
+            folder_path = os.path.join(self.inbox_dir, name)
+            if not os.path.isdir(folder_path):
+                continue
+            seen.add(folder_path)
+            with self._lock:
+                if folder_path in self._queued or folder_path in self._stuck:
+                    continue
+            if os.path.exists(os.path.join(folder_path, PROCESSED_MARKER)):
+                # Stuck from an earlier run of the daemon
+                with self._lock:
+                    self._stuck.add(folder_path)
+                continue
+            try:
+                if not self._is_ready(folder_path):
+                    continue
+            except OSError:
+                continue
+            with self._lock:
+                self._queued.add(folder_path)
+            self._snapshots.pop(folder_path, None)
+            self._executor.submit(self._run_job, folder_path)
+            print(f"[watch] Queued: {name} (queue depth: {self.queue_depth()})")
+            submitted += 1
+        for gone in set(self._snapshots) - seen:
+            del self._snapshots[gone]
+        return submitted
+
+    # --- Execution ---
+    def _run_job(self, folder_path: str):
+        with self._lock:
+            self._running += 1
+        start = time.time()
+        ok = False
+        try:
+            ok = bool(self.process_fn(folder_path))
+        except Exception as e:
+            print(f"[watch] Error processing {folder_path}: {e}")
+        elapsed = time.time() - start
+
+        dest_dir = self.done_dir if ok else self.failed_dir
+        name = os.path.basename(folder_path)
+        moved = False
+        try:
+            dest = _unique_destination(dest_dir, name)
+            shutil.move(folder_path, dest)
+            moved = True
+            print(f"[watch] {'Done' if ok else 'Failed'}: {name} -> {dest} ({elapsed:.1f}s)")
+        except Exception as e:
+            # p.ej. un PDF abierto o el antivirus bloqueando un archivo (Windows): si quedara en
+            # el inbox se volvería a procesar y el candidato recibiría otro email
+            print(f"[watch] Error moving {folder_path}: {e}. "
+                  f"It won't be processed again; move it to {dest_dir} manually.")
+            try:
+                with open(os.path.join(folder_path, PROCESSED_MARKER), "w", encoding="utf-8") as f:
+                    f.write("done\n" if ok else "failed\n")
+            except OSError as marker_error:
+                print(f"[watch] Warning: could not mark {folder_path} as processed: {marker_error}")
+
+        with self._lock:
+            self._running -= 1
+            self._queued.discard(folder_path)
+            if not moved:
+                self._stuck.add(folder_path)
+            if ok:
+                self._processed += 1
+            else:
+                self._failed += 1
+            self._total_seconds += elapsed
+            self._finished_at.append(time.time())
+        self.write_status()
+
+    # --- Metrics ---
+    def queue_depth(self) -> int:
+        """Folders waiting for a free worker (not counting the ones being processed)."""
+        with self._lock:
+            return len(self._queued) - self._running
+
+    def stats(self) -> Dict[str, object]:
+        now = time.time()
+        with self._lock:
+            while self._finished_at and now - self._finished_at[0] > 60:
+                self._finished_at.popleft()
+            finished = self._processed + self._failed
+            return {
+                "queue_depth": len(self._queued) - self._running,
+                "in_progress": self._running,
+                "processed": self._processed,
+                "failed": self._failed,
+                "stuck": sorted(os.path.basename(p) for p in self._stuck),
+                "throughput_per_min": len(self._finished_at),
+                "avg_seconds_per_client": round(self._total_seconds / finished, 2) if finished else 0.0,
+                "uptime_seconds": round(now - self._started_at, 1),
+            }
+
+    def write_status(self):
+        stats = self.stats()
+        stats["updated"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            with open(os.path.join(self.inbox_dir, STATUS_FILE), "w", encoding="utf-8") as f:
+                json.dump(stats, f, indent=4)
+        except OSError as e:
+            print(f"[watch] Warning: could not write status file: {e}")
+
+    # --- Loop ---
+    def run_forever(self):
+        print(f"--- Watching inbox: {self.inbox_dir} ---")
+        print(f"Done: {self.done_dir} | Failed: {self.failed_dir} | Workers: {self.workers}")
+        print(f"Una carpeta se procesa al crear '{self.ready_marker}' o tras {self.quiet_seconds:.0f}s sin cambios.")
+        self.write_status()
+        try:
+            while True:
+                if self.scan_once():
+                    self.write_status()
+                time.sleep(self.poll_seconds)
+        except KeyboardInterrupt:
+            print("\n[watch] Stopping, waiting for running jobs to finish...")
+        finally:
+            self._executor.shutdown(wait=True)
+            self.write_status()
+            print(f"[watch] Final stats: {self.stats()}")
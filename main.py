@@ -1,25 +1,47 @@
 import os
-import sys
 import json
+import argparse
+import functools
 import mimetypes
 from cv_parser import parse_cv_multimodal
 from cv_dividers_only import generate_divider, generate_divider_smaller, generate_divider_larger, generate_divider_tiny, create_circular_image_with_border
 from email_sender import send_cvs_email
+from pipeline_profiler import PipelineProfiler, profile_stage, profiling_requested
+from memory_budget import MemoryTracker
 
-def main():
-    # Usage: python main.py [client_folder_path]
-    
-    # 1. Input Handling: Folder Path
-    folder_path = "input_samples/default_client"
-    if len(sys.argv) > 1:
-        folder_path = sys.argv[1]
-    
-    if not os.path.exists(folder_path):
-        print(f"Error: Client folder '{folder_path}' not found.")
-        print("Usage: python main.py path/to/client_folder")
-        return
+def process_client_folder(folder_path: str, profile: bool = False) -> bool:
+    """
+    Runs the full pipeline (parse -> photo -> PDFs -> email) for one client folder.
+    Returns True if the folder was processed, False if any step failed.
+    With profile=True (or CV_PROFILE=1) the run is profiled into folder_path/profile.
+    """
+    client = _client_label(folder_path)
+    memory = MemoryTracker()
+    try:
+        if not profiling_requested(profile):
+            return _run_pipeline(folder_path, memory)
+        with PipelineProfiler(folder_path, label=client):
+            return _run_pipeline(folder_path, memory)
+    finally:
+        memory.close()
+        if memory.enabled:
+            # Memory-bounded mode: peak RSS per stage saved next to the PDFs
+            # (inside output_cvs so a re-run doesn't send it to Gemini as input)
+            report = memory.report()
+            print(f"[{client}] Peak RSS per stage (MB): {report['stages']} (target {report['limit_mb']:.0f} MB)")
+            report_dir = os.path.join(folder_path, "output_cvs")
+            if not os.path.exists(report_dir):
+                os.makedirs(report_dir)
+            with open(os.path.join(report_dir, "memory_report.json"), "w", encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+
+def _client_label(folder_path: str) -> str:
+    return os.path.basename(os.path.normpath(folder_path))
 
-    print(f"--- Processing Client Folder: {folder_path} ---")
+def _run_pipeline(folder_path: str, memory: MemoryTracker) -> bool:
+    # Every line is prefixed with the client folder: in --watch mode several clients run at once
+    client = _client_label(folder_path)
+    print(f"[{client}] --- Processing Client Folder: {folder_path} ---")
 
     # 2. File Scanning & Classification
     input_files_for_gemini = []
@@ -47,7 +69,7 @@ def main():
             # Otherwise treat as document (screenshot of old CV)
             if any(k in lower_name for k in ['foto', 'perfil', 'profile', 'face']):
                 profile_image_path = full_path
-                print(f"Found Profile Picture: {fname}")
+                print(f"[{client}] Found Profile Picture: {fname}")
             else:
                 # If we don't have a profile pic yet, and this is an image, treat as potential content or photo
                 # For now, let's treat generic images as content for Gemini (screenshots of text)
@@ -60,36 +82,38 @@ def main():
             input_files_for_gemini.append(full_path)
 
     if not input_files_for_gemini and not profile_image_path:
-        print("No files found in folder to process.")
-        return
+        print(f"[{client}] No files found in folder to process.")
+        return False
 
     # 3. Multimodal Parsing
-    print(f"Sending {len(input_files_for_gemini)} files to Gemini for parsing...")
+    print(f"[{client}] Sending {len(input_files_for_gemini)} files to Gemini for parsing...")
     try:
-        cv_data = parse_cv_multimodal(input_files_for_gemini)
-        print("CV Data parsed successfully.")
+        with profile_stage("parsing"), memory.stage("parsing"):
+            cv_data = parse_cv_multimodal(input_files_for_gemini)
+        print(f"[{client}] CV Data parsed successfully.")
         
         # Debug save
         with open(os.path.join(folder_path, "parsed_data_debug.json"), "w", encoding='utf-8') as f:
             json.dump(cv_data, f, indent=2, ensure_ascii=False)
             
     except Exception as e:
-        print(f"Failed to parse CV data: {e}")
-        return
+        print(f"[{client}] Failed to parse CV data: {e}")
+        return False
 
     # 4. Image Processing for PDF
     processed_image_out = None
     if profile_image_path:
-        print(f"Processing profile image: {profile_image_path}")
+        print(f"[{client}] Processing profile image: {profile_image_path}")
         # Save processed in the client folder
         clean_img_name = f"processed_{os.path.basename(profile_image_path)}"
         processed_image_path = os.path.join(folder_path, clean_img_name)
         # Note: changing extension to png in logic, make sure path handles it
         processed_image_out = os.path.splitext(processed_image_path)[0] + ".png"
         
-        res = create_circular_image_with_border(profile_image_path, processed_image_out)
+        with profile_stage("image_processing"), memory.stage("image_processing"):
+            res = create_circular_image_with_border(profile_image_path, processed_image_out)
         if not res:
-            print("Warning: Failed to process profile image.")
+            print(f"[{client}] Warning: Failed to process profile image.")
             processed_image_out = None
 
     # 5. PDF Generation
@@ -97,20 +121,21 @@ def main():
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    print("Generating PDFs...")
+    print(f"[{client}] Generating PDFs...")
     generated_pdfs = []
     try:
-        path_n = generate_divider(cv_data, out_dir=output_dir, image_path=processed_image_out)
-        path_s = generate_divider_smaller(cv_data, out_dir=output_dir, image_path=processed_image_out)
-        path_l = generate_divider_larger(cv_data, out_dir=output_dir, image_path=processed_image_out)
-        path_t = generate_divider_tiny(cv_data, out_dir=output_dir, image_path=processed_image_out)
+        with profile_stage("pdf_generation"), memory.stage("pdf_generation"):
+            path_n = generate_divider(cv_data, out_dir=output_dir, image_path=processed_image_out)
+            path_s = generate_divider_smaller(cv_data, out_dir=output_dir, image_path=processed_image_out)
+            path_l = generate_divider_larger(cv_data, out_dir=output_dir, image_path=processed_image_out)
+            path_t = generate_divider_tiny(cv_data, out_dir=output_dir, image_path=processed_image_out)
         
         generated_pdfs = [path_n, path_s, path_l, path_t]
-        print(f"PDFs created in: {output_dir}")
+        print(f"[{client}] PDFs created in: {output_dir}")
         
     except Exception as e:
-        print(f"Error generating PDFs: {e}")
-        return
+        print(f"[{client}] Error generating PDFs: {e}")
+        return False
 
     # 6. Email Delivery
     # Check env vars
@@ -121,14 +146,61 @@ def main():
     candidate_name = cv_data.get("nombre", "Candidato")
 
     if gmail_user and gmail_pass and candidate_email:
-        print(f"Sending email to {candidate_email}...")
-        send_cvs_email(candidate_email, generated_pdfs, candidate_name, gmail_user, gmail_pass)
+        print(f"[{client}] Sending email to {candidate_email}...")
+        with profile_stage("email"), memory.stage("email"):
+            sent = send_cvs_email(candidate_email, generated_pdfs, candidate_name, gmail_user, gmail_pass)
+        if not sent:
+            return False
     else:
-        print("\n--- Skipping Email ---")
+        print(f"[{client}] --- Skipping Email ---")
         if not candidate_email:
-            print("Reason: No email found in parsed CV data.")
+            print(f"[{client}] Reason: No email found in parsed CV data.")
         elif not (gmail_user and gmail_pass):
-            print("Reason: Gmail credentials (GMAIL_USER, GMAIL_APP_PASSWORD) not set in environment.")
+            print(f"[{client}] Reason: Gmail credentials (GMAIL_USER, GMAIL_APP_PASSWORD) not set in environment.")
+
+    return True
+
+def main():
+    # Usage: python main.py [client_folder_path]
+    #        python main.py --watch INBOX [--workers N] [--quiet-seconds S]
+    parser = argparse.ArgumentParser(description="CV bot: procesa carpetas de clientes.")
+    parser.add_argument("folder", nargs="?", default="input_samples/default_client",
+                        help="Carpeta del cliente a procesar (modo de una sola ejecución).")
+    parser.add_argument("--watch", metavar="INBOX",
+                        help="Modo daemon: vigila INBOX y procesa cada carpeta nueva que aparezca.")
+    parser.add_argument("--done", metavar="DIR", help="Destino de carpetas terminadas (default: INBOX/../done).")
+    parser.add_argument("--failed", metavar="DIR", help="Destino de carpetas con error (default: INBOX/../failed).")
+    parser.add_argument("--workers", type=int, default=2, help="Cantidad de workers persistentes.")
+    parser.add_argument("--quiet-seconds", type=float, default=10.0,
+                        help="Segundos sin cambios para considerar completa una carpeta sin marcador.")
+    parser.add_argument("--poll-seconds", type=float, default=2.0, help="Intervalo de escaneo del inbox.")
+    parser.add_argument("--profile", action="store_true",
+                        help="Perfila la ejecución (cProfile + tracemalloc) y guarda el reporte en la carpeta/profile.")
+    args = parser.parse_args()
+
+    # 1. Input Handling: Watch mode
+    if args.watch:
+        from folder_watcher import FolderWatcher
+        watcher = FolderWatcher(
+            args.watch,
+            functools.partial(process_client_folder, profile=args.profile),
+            done_dir=args.done,
+            failed_dir=args.failed,
+            workers=args.workers,
+            quiet_seconds=args.quiet_seconds,
+            poll_seconds=args.poll_seconds,
+        )
+        watcher.run_forever()
+        return
+
+    # 1. Input Handling: Folder Path
+    folder_path = args.folder
+    if not os.path.exists(folder_path):
+        print(f"Error: Client folder '{folder_path}' not found.")
+        print("Usage: python main.py path/to/client_folder")
+        return
+
+    process_client_folder(folder_path, profile=args.profile)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,107 @@
+"""
+memory_budget.py — modo de memoria acotada para instancias chicas (Vercel).
+Se activa definiendo CV_MEMORY_LIMIT_MB (objetivo de pico de RSS). En ese modo el
+pipeline adjunta los PDFs en streaming, decodifica las fotos reducidas, libera buffers
+entre etapas y registra el pico de RSS de cada etapa en el resultado del trabajo.
+"""
+
+import os
+import gc
+import sys
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+MEMORY_LIMIT_ENV_VAR = "CV_MEMORY_LIMIT_MB"
+SAMPLE_INTERVAL_SECONDS = 0.02
+# Long edge used when decoding photos in bounded mode (the PDF shows them at 2.8 cm)
+BOUNDED_PHOTO_MAX_EDGE = 800
+
+def memory_limit_mb() -> Optional[float]:
+    value = os.environ.get(MEMORY_LIMIT_ENV_VAR, "").strip()
+    try:
+        return float(value) if value else None
+    except ValueError:
+        print(f"Warning: Invalid {MEMORY_LIMIT_ENV_VAR}={value!r}, memory-bounded mode disabled.")
+        return None
+
+def memory_bounded() -> bool:
+    return memory_limit_mb() is not None
+
+def current_rss_bytes() -> Optional[int]:
+    """Current resident set size, or the high-water mark where only that is available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        return None  # Windows without /proc nor resource
+
+def release_memory():
+    """Drops unreachable buffers (decoded images, PDF flowables) between stages."""
+    gc.collect()
+
+class MemoryTracker:
+    """
+    Samples RSS in a background thread and records the peak of each pipeline stage.
+    Disabled (stages are plain pass-throughs) unless the memory-bounded mode is on.
+    RSS is process-wide, so concurrent jobs in the same instance show up in each other's peaks.
+    """
+
+    def __init__(self, limit_mb: Optional[float] = None, enabled: Optional[bool] = None):
+        self.limit_mb = limit_mb if limit_mb is not None else memory_limit_mb()
+        self.enabled = self.limit_mb is not None if enabled is None else enabled
+        self.stages: Dict[str, float] = {}
+        self._current_peak = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def _sample(self):
+        while not self._stop.wait(SAMPLE_INTERVAL_SECONDS):
+            rss = current_rss_bytes()
+            if rss is not None:
+                with self._lock:
+                    self._current_peak = max(self._current_peak, rss)
+
+    @contextmanager
+    def stage(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        if self._sampler is None:
+            self._sampler = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+            self._sampler.start()
+        with self._lock:
+            self._current_peak = current_rss_bytes() or 0
+        try:
+            yield
+        finally:
+            rss = current_rss_bytes() or 0
+            with self._lock:
+                peak = max(self._current_peak, rss)
+            mb = round(peak / (1024 * 1024), 1)
+            self.stages[name] = max(self.stages.get(name, 0.0), mb)
+            if self.limit_mb and mb > self.limit_mb:
+                print(f"Warning: Stage '{name}' peaked at {mb} MB RSS (target {self.limit_mb:.0f} MB).")
+            release_memory()
+
+    def close(self):
+        self._stop.set()
+
+    def report(self) -> Optional[Dict]:
+        if not self.enabled:
+            return None
+        peak = max(self.stages.values()) if self.stages else 0.0
+        return {
+            "limit_mb": self.limit_mb,
+            "peak_rss_mb": peak,
+            "within_limit": self.limit_mb is None or peak <= self.limit_mb,
+            "stages": dict(self.stages),
+        }
@@ -0,0 +1,197 @@
+"""
+pipeline_profiler.py — perfilado opcional de una ejecución del pipeline.
+Se activa con la variable de entorno CV_PROFILE=1, con `python main.py --profile`
+o con el header `X-CV-Profile: <token>` en /process (solo si el servidor define
+CV_PROFILE_TOKEN). Guarda un cProfile y snapshots de tracemalloc en
+<carpeta de salida>/profile/ junto con un resumen por etapa.
+"""
+
+import os
+import io
+import hmac
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List
+
+PROFILE_ENV_VAR = "CV_PROFILE"
+PROFILE_HEADER = "X-CV-Profile"
+PROFILE_TOKEN_ENV_VAR = "CV_PROFILE_TOKEN"
+TOP_FUNCTIONS = 15
+TOP_ALLOCATIONS = 10
+
+_current = threading.local()
+# tracemalloc (start/stop, peak, snapshots) is process-wide: one profiled run at a time
+_run_lock = threading.Lock()
+
+def profiling_requested(flag: bool = False) -> bool:
+    """True if profiling was asked for explicitly (flag/header) or via CV_PROFILE."""
+    if flag:
+        return True
+    return os.environ.get(PROFILE_ENV_VAR, "").strip().lower() in ("1", "true", "yes", "on")
+
+def profile_header_allowed(header_value: str) -> bool:
+    """The /process header only enables profiling if it matches the server's CV_PROFILE_TOKEN."""
+    token = os.environ.get(PROFILE_TOKEN_ENV_VAR, "")
+    if not token or not header_value:
+        return False
+    return hmac.compare_digest(header_value.strip().encode("utf-8"), token.encode("utf-8"))
+
+def profile_stage(name: str):
+    """
+    Marks a pipeline stage. A no-op unless a PipelineProfiler is active in this thread,
+    so library code (cv_parser, cv_dividers_only) can call it unconditionally.
+    """
+    profiler = getattr(_current, "profiler", None)
+    if profiler is None:
+        return nullcontext()
+    return profiler.stage(name)
+
+class _Frame:
+    def __init__(self, name: str):
+        self.name = name
+        self.profile = cProfile.Profile()
+        self.peak = 0
+        self.start_mem = 0
+        self.start_time = 0.0
+        self.start_snapshot = None
+
+class PipelineProfiler:
+    """Context manager that profiles one pipeline run and writes reports to out_dir/profile."""
+
+    def __init__(self, out_dir: str, label: str = "run"):
+        self.out_dir = os.path.join(out_dir, "profile")
+        self.label = label
+        self._stack: List[_Frame] = []
+        self._stats: Dict[str, pstats.Stats] = {}
+        self._timings: Dict[str, Dict[str, float]] = {}
+        self._alloc_diffs: Dict[str, list] = {}
+        self._final_snapshot = None
+        self._started_tracemalloc = False
+
+    # --- Lifecycle ---
+    def __enter__(self):
+        # Concurrent profiled runs (daemon workers, threaded Flask) wait their turn
+        _run_lock.acquire()
+        try:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+                self._started_tracemalloc = True
+            _current.profiler = self
+            self._push(self.label)
+        except Exception:
+            self._finish()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self._pop()
+            self._write_reports()
+        except Exception as e:
+            print(f"Warning: Could not write profile reports: {e}")
+        finally:
+            self._finish()
+        return False
+
+    def _finish(self):
+        _current.profiler = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        _run_lock.release()
+
+    @contextmanager
+    def stage(self, name: str):
+        self._push(name)
+        try:
+            yield
+        finally:
+            self._pop()
+
+    # --- Stack handling: only the innermost cProfile is enabled at a time ---
+    def _push(self, name: str):
+        if self._stack:
+            parent = self._stack[-1]
+            parent.profile.disable()
+            parent.peak = max(parent.peak, tracemalloc.get_traced_memory()[1])
+        frame = _Frame(name)
+        frame.start_snapshot = tracemalloc.take_snapshot()
+        frame.start_mem = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        frame.start_time = time.perf_counter()
+        self._stack.append(frame)
+        frame.profile.enable()
+
+    def _pop(self):
+        frame = self._stack.pop()
+        frame.profile.disable()
+        elapsed = time.perf_counter() - frame.start_time
+        current, peak = tracemalloc.get_traced_memory()
+        frame.peak = max(frame.peak, peak)
+        end_snapshot = tracemalloc.take_snapshot()
+
+        stats = pstats.Stats(frame.profile)
+        if frame.name in self._stats:
+            self._stats[frame.name].add(stats)
+        else:
+            self._stats[frame.name] = stats
+
+        timing = self._timings.setdefault(frame.name, {"calls": 0, "seconds": 0.0, "peak_bytes": 0, "delta_bytes": 0})
+        timing["calls"] += 1
+        timing["seconds"] += elapsed
+        timing["peak_bytes"] = max(timing["peak_bytes"], frame.peak)
+        timing["delta_bytes"] += current - frame.start_mem
+        self._alloc_diffs[frame.name] = end_snapshot.compare_to(frame.start_snapshot, "lineno")[:TOP_ALLOCATIONS]
+
+        if self._stack:
+            parent = self._stack[-1]
+            parent.peak = max(parent.peak, frame.peak)
+            tracemalloc.reset_peak()
+            parent.profile.enable()
+        else:
+            self._final_snapshot = end_snapshot
+
+    # --- Reports ---
+    def _write_reports(self):
+        if not os.path.exists(self.out_dir):
+            os.makedirs(self.out_dir)
+
+        # One .prof per stage plus the merged run (readable with pstats or snakeviz)
+        prof_paths = []
+        for name, stats in self._stats.items():
+            path = os.path.join(self.out_dir, f"{_file_safe(name)}.prof")
+            stats.dump_stats(path)
+            prof_paths.append(path)
+        if prof_paths:
+            pstats.Stats(*prof_paths).dump_stats(os.path.join(self.out_dir, "full_run.prof"))
+        if self._final_snapshot is not None:
+            self._final_snapshot.dump(os.path.join(self.out_dir, "memory.snapshot"))
+
+        out = io.StringIO()
+        out.write(f"Profile: {self.label}\n")
+        out.write("Stages (inclusive wall time, nested stages excluded from cProfile):\n")
+        for name, t in self._timings.items():
+            out.write(f"  {name:<24} calls={t['calls']:<3} time={t['seconds']:.3f}s "
+                      f"peak={t['peak_bytes'] / 1e6:.1f}MB delta={t['delta_bytes'] / 1e6:+.1f}MB\n")
+
+        for name, stats in self._stats.items():
+            out.write(f"\n=== {name}: top {TOP_FUNCTIONS} by cumulative time ===\n")
+            stats.stream = out
+            stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+            out.write(f"--- {name}: top allocations during stage ---\n")
+            for diff in self._alloc_diffs.get(name, []):
+                out.write(f"  {diff}\n")
+
+        summary_path = os.path.join(self.out_dir, "summary.txt")
+        with open(summary_path, "w", encoding="utf-8") as f:
+            f.write(out.getvalue())
+        print(f"Profile saved in: {self.out_dir}")
+        for name, t in self._timings.items():
+            print(f"  {name:<24} {t['seconds']:.3f}s  peak {t['peak_bytes'] / 1e6:.1f}MB")
+
+def _file_safe(name: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in name).strip("_") or "stage"
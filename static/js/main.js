@@ -223,6 +223,8 @@ document.addEventListener('DOMContentLoaded', () => {
                 // Clear inputs
                 clearInputs();
 
+            } else if (response.status === 429 || response.status === 503) {
+                alert(`El servidor está ocupado. Reintentá en ${data.retry_after || 30} segundos.`);
             } else {
                 alert('Error: ' + (data.error || 'Ocurrió un problema en el servidor.'));
             }
@@ -0,0 +1,126 @@
+import os
+import sys
+import smtplib
+import subprocess
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import email_sender
+from memory_budget import MemoryTracker, current_rss_bytes
+from cv_dividers_only import create_circular_image_with_border
+
+LIMIT_MB = 150
+ATTACHMENT_MB = 40
+ATTACHMENTS = 3
+
+pytestmark = pytest.mark.skipif(current_rss_bytes() is None, reason="RSS not measurable on this platform")
+
+
+class FakeSMTP:
+    """Accepts the SMTP dialogue and discards the DATA bytes, counting them."""
+
+    def __init__(self, *args, **kwargs):
+        self.sent = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def login(self, user, password):
+        pass
+
+    def ehlo_or_helo_if_needed(self):
+        pass
+
+    def mail(self, sender):
+        return 250, b"OK"
+
+    def rcpt(self, recipient):
+        return 250, b"OK"
+
+    def docmd(self, cmd):
+        return 354, b"Go ahead"
+
+    def send(self, data):
+        self.sent += len(data)
+
+    def getreply(self):
+        return 250, b"Queued"
+
+    def send_message(self, msg):
+        raise AssertionError("bounded mode must not build the whole message")
+
+
+def _mb(n_bytes):
+    return n_bytes / (1024 * 1024)
+
+
+@pytest.fixture
+def bounded(monkeypatch):
+    monkeypatch.setenv("CV_MEMORY_LIMIT_MB", str(LIMIT_MB))
+
+
+@pytest.fixture
+def big_pdfs(tmp_path):
+    paths = []
+    for i in range(ATTACHMENTS):
+        path = tmp_path / f"CV_Test_{i}.pdf"
+        with open(path, "wb") as f:
+            for _ in range(ATTACHMENT_MB):
+                f.write(os.urandom(1024 * 1024))
+        paths.append(str(path))
+    return paths
+
+
+@pytest.fixture
+def big_photo(tmp_path):
+    # Built in a child process so its decoded buffers don't inflate this process' RSS
+    path = tmp_path / "foto_perfil.jpg"
+    code = ("import sys; from PIL import Image; "
+            "Image.effect_noise((6000, 4000), 60).convert('RGB').save(sys.argv[1], quality=90)")
+    subprocess.run([sys.executable, "-c", code, str(path)], check=True)
+    return str(path)
+
+
+def test_streaming_email_and_photo_stay_within_limit(bounded, big_pdfs, big_photo, tmp_path, monkeypatch):
+    smtp = FakeSMTP()
+    monkeypatch.setattr(smtplib, "SMTP_SSL", lambda *a, **k: smtp)
+
+    tracker = MemoryTracker()
+    assert tracker.enabled
+
+    baseline = _mb(current_rss_bytes())
+    with tracker.stage("email"):
+        ok = email_sender.send_cvs_email("cliente@example.com", big_pdfs, "Test", "bot@example.com", "pw",
+                                         stream_attachments=True)
+    assert ok
+    # Everything was sent as base64 (~4/3 of the input)
+    assert smtp.sent > ATTACHMENTS * ATTACHMENT_MB * 1024 * 1024 * 4 / 3
+
+    photo_baseline = _mb(current_rss_bytes())
+    out_path = str(tmp_path / "processed_profile.png")
+    with tracker.stage("image_processing"):
+        assert create_circular_image_with_border(big_photo, out_path) == out_path
+    tracker.close()
+
+    report = tracker.report()
+    assert report["within_limit"], report
+    assert report["peak_rss_mb"] <= LIMIT_MB
+    assert set(report["stages"]) == {"email", "image_processing"}
+    # 120 MB of attachments must not be held in memory (not even once)
+    assert report["stages"]["email"] - baseline < ATTACHMENT_MB
+    # A full 24 MP RGBA decode is ~92 MB; bounded mode decodes a reduced draft
+    assert report["stages"]["image_processing"] - photo_baseline < 40
+
+
+def test_tracker_disabled_without_limit(monkeypatch):
+    monkeypatch.delenv("CV_MEMORY_LIMIT_MB", raising=False)
+    tracker = MemoryTracker()
+    with tracker.stage("parsing"):
+        pass
+    assert not tracker.enabled
+    assert tracker.report() is None